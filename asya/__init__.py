@@ -1,4 +1,4 @@
 from .cli import main
-from .logic import gather_acquaintances
+from .logic import gather_acquaintances, gather_acquaintances_async
 
-__all__=['main', 'gather_acquaintances']
+__all__=['main', 'gather_acquaintances', 'gather_acquaintances_async']
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import click
+from aiohttp import web
+
+from .logic import gather_acquaintances_async
+from .supervisor import AsyaSupervisor
+from .transport import TRANSPORTS
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # optional, needed only for HTTP/2 stub server
+    h2 = None
+
+
+class StubGitHub:
+    """
+    Stub of GitHub API serving generated issues search and comments
+    (with simulated latency) for benchmarking of transports
+
+    :ivar endpoint: API endpoint of the stub (set when server starts)
+    :ivar issues: number of issues found by any search
+    :ivar comments: number of comments of each issue
+    :ivar users: number of distinct commenters
+    :ivar latency: seconds to wait before each response
+    :ivar requests: number of served requests
+    :ivar connections: number of accepted connections
+    """
+
+    def __init__(self, issues=100, comments=250, users=20, latency=0.02):
+        self.endpoint = None
+        self.issues = issues
+        self.comments = comments
+        self.users = users
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+
+    def _page(self, total, query, make_item, path):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['30'])[0])
+        start = (page - 1) * per_page
+        items = [make_item(i) for i in range(start,
+                                             min(total, start + per_page))]
+        headers = {}
+        last = max(1, -(-total // per_page))
+        if last > 1:
+            headers['Link'] = '<{}{}?page={}>; rel="last"'.format(
+                self.endpoint, path, last
+            )
+        return items, headers
+
+    def _issue(self, number):
+        url = '{}/repos/stub/stub/issues/{}'.format(self.endpoint, number)
+        return {'number': number, 'url': url, 'comments': self.comments,
+                'comments_url': url + '/comments'}
+
+    def _comment(self, issue, number):
+        login = 'user{}'.format((issue * 7 + number) % self.users)
+        return {'id': number, 'user': {'login': login}}
+
+    async def respond(self, path, query):
+        """
+        Create response for the request
+
+        :param path: path of the request
+        :type path: str
+        :param query: parsed query of the request (see :func:`parse_qs`)
+        :type query: dict
+        :return: tuple of status, headers and body
+        :rtype: tuple
+        """
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        parts = path.strip('/').split('/')
+        if path == '/search/issues':
+            items, headers = self._page(self.issues, query,
+                                        self._issue, path)
+            data = {'total_count': self.issues, 'items': items}
+        elif len(parts) == 6 and parts[-1] == 'comments':
+            issue = int(parts[-2])
+            data, headers = self._page(
+                self.comments, query,
+                lambda n: self._comment(issue, n), path
+            )
+        else:
+            return 404, {}, json.dumps({'message': 'Not Found'}).encode()
+        return 200, headers, json.dumps(data).encode()
+
+
+async def start_http1_stub(stub, host='127.0.0.1', port=0):
+    """Start HTTP/1.1 server (:mod:`aiohttp.web`) for the stub"""
+    async def handle(request):
+        status, headers, body = await stub.respond(
+            request.path, parse_qs(request.query_string)
+        )
+        return web.Response(status=status, headers=headers, body=body,
+                            content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get('/{path:.*}', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    def create_protocol():
+        stub.connections += 1
+        return runner.server()
+
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(create_protocol, host, port)
+    return server, runner
+
+
+class H2StubProtocol(asyncio.Protocol):
+    """Minimal cleartext HTTP/2 (h2c, prior knowledge) server protocol
+    for the stub (via :mod:`h2`)"""
+
+    def __init__(self, stub):
+        self.stub = stub
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False,
+                                             header_encoding='utf-8')
+        )
+        self.transport = None
+        self.windows = {}
+
+    def connection_made(self, transport):
+        self.stub.connections += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                asyncio.ensure_future(
+                    self.respond(event.stream_id, dict(event.headers))
+                )
+            elif isinstance(event, h2.events.WindowUpdated):
+                for window in self.windows.values():
+                    window.set()
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc):
+        for window in self.windows.values():
+            window.set()
+
+    async def respond(self, stream_id, headers):
+        url = urlsplit(headers[':path'])
+        status, extra, body = await self.stub.respond(url.path,
+                                                      parse_qs(url.query))
+        response = [(':status', str(status)),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(body)))]
+        response.extend((k.lower(), v) for k, v in extra.items())
+        self.conn.send_headers(stream_id, response)
+        self.windows[stream_id] = asyncio.Event()
+        while not self.transport.is_closing():
+            size = min(len(body), self.conn.max_outbound_frame_size,
+                       self.conn.local_flow_control_window(stream_id))
+            if size == 0 and len(body) > 0:
+                self.windows[stream_id].clear()
+                await self.windows[stream_id].wait()
+                continue
+            self.conn.send_data(stream_id, body[:size],
+                                end_stream=size == len(body))
+            self.transport.write(self.conn.data_to_send())
+            body = body[size:]
+            if len(body) == 0:
+                break
+        del self.windows[stream_id]
+
+
+async def start_h2_stub(stub, host='127.0.0.1', port=0):
+    """Start cleartext HTTP/2 server for the stub (requires ``h2``)"""
+    if h2 is None:
+        raise ImportError('HTTP/2 stub server requires h2 '
+                          '(pip install httpx[http2])')
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(lambda: H2StubProtocol(stub),
+                                      host, port)
+    return server, None
+
+
+STUB_SERVERS = {
+    'aiohttp': start_http1_stub,
+    'http2': start_h2_stub,
+}
+
+
+async def run_benchmark(transport, stub):
+    """
+    Gather acquaintances from the stub served for given transport
+
+    :param transport: name of the transport
+    :type transport: str
+    :param stub: stub of the GitHub API
+    :type stub: asya.benchmark.StubGitHub
+    :return: dictionary with measured values
+    :rtype: dict
+    """
+    server, runner = await STUB_SERVERS[transport](stub)
+    host, port = server.sockets[0].getsockname()[:2]
+    stub.endpoint = 'http://{}:{}'.format(host, port)
+    stub.requests = stub.connections = 0
+    supervisor = AsyaSupervisor(stub.endpoint, None, False, False)
+    try:
+        start = time.perf_counter()
+        counts = await gather_acquaintances_async({'q': 'author:stub'},
+                                                  supervisor,
+                                                  transport=transport)
+        seconds = time.perf_counter() - start
+    finally:
+        server.close()
+        if runner is not None:
+            await runner.cleanup()
+    return {'transport': transport, 'seconds': seconds,
+            'requests': stub.requests, 'connections': stub.connections,
+            'comments': sum(counts.values())}
+
+
+@click.command()
+@click.option('--transport', type=click.Choice(sorted(TRANSPORTS)),
+              multiple=True, help='Transport(s) to benchmark (default all).')
+@click.option('--issues', type=int, default=100,
+              help='Number of issues served by the stub.')
+@click.option('--comments', type=int, default=250,
+              help='Number of comments of each issue.')
+@click.option('--latency', type=float, default=0.02,
+              help='Seconds of latency of each stub response.')
+@click.version_option('0.1')
+def bench(transport, issues, comments, latency):
+    """Asya transports benchmark against local GitHub API stub"""
+    stub = StubGitHub(issues, comments, latency=latency)
+    loop = asyncio.get_event_loop()
+    for name in transport or sorted(TRANSPORTS):
+        try:
+            result = loop.run_until_complete(run_benchmark(name, stub))
+        except ImportError as err:
+            click.secho('{}: skipped ({})'.format(name, err), fg='yellow')
+            continue
+        click.echo('{transport:8} {seconds:8.3f}s {requests:6} requests '
+                   '{connections:5} connections {comments:8} comments'
+                   .format(**result))
+    loop.close()
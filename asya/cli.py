@@ -1,11 +1,16 @@
+import asyncio
 import sys
 from datetime import datetime
 
 import click
 
 from .supervisor import AsyaSupervisor
-from .logic import gather_acquaintances
+from .logic import gather_acquaintances, gather_acquaintance_graph
+from .estimation import estimate_acquaintances
 from .exceptions import AsyaException
+from .profiling import Profiler
+from .tracing import Tracer
+from .transport import TRANSPORTS
 
 
 _user_involvement = ('author', 'involves', 'mentions',
@@ -68,17 +73,31 @@ def setup_progressbar(supervisor):
                            ' although there are {} issues)'.format(
                     API_SEARCH_LIMIT, first_result['total_count']
                 ))
-            supervisor.data['bar'].length = nresults
+            supervisor.data['bar'].length += nresults
             supervisor.data['bar'].entered = True
             supervisor.data['bar'].render_progress()
 
     def increase_bar(issue):
         supervisor.data['bar'].update(1)
 
+    def sampled_pages(estimates, requests, pages):
+        supervisor.data['bar'].label = 'Sampling comment pages'
+        supervisor.data['bar'].length = pages
+        supervisor.data['bar'].update(requests - supervisor.data['bar'].pos)
+
     def finish_bar():
         supervisor.data['bar'].finish()
         supervisor.data['bar'].render_finish()
 
+    supervisor.data['completeness'] = None
+
+    def store_completeness(completeness):
+        supervisor.data['completeness'] = completeness
+
+    def report_completeness():
+        if supervisor.data['completeness'] is not None:
+            echo_completeness(supervisor.data['completeness'])
+
     def waiting_phase_change(active, headers):
         to_time = int(headers['X-RateLimit-Reset'])
         if active and to_time > supervisor.data['waiting']:
@@ -94,12 +113,27 @@ def setup_progressbar(supervisor):
 
     supervisor.callbacks['issues_search_page'].append(init_bar)
     supervisor.callbacks['issue'].append(increase_bar)
+    supervisor.callbacks['issue_reused'].append(increase_bar)
+    supervisor.callbacks['issue_over_budget'].append(increase_bar)
+    supervisor.callbacks['estimate_round'].append(sampled_pages)
     supervisor.callbacks['skip'].append(add_skipped)
     supervisor.callbacks['wait'].append(waiting_phase_change)
+    supervisor.callbacks['completeness'].append(store_completeness)
     supervisor.callbacks['finish_successful'].append(finish_bar)
     supervisor.callbacks['finish_errored'].append(finish_bar)
     supervisor.callbacks['finish_successful'].append(report_skipped)
     supervisor.callbacks['finish_errored'].append(report_skipped)
+    supervisor.callbacks['finish_successful'].append(report_completeness)
+
+
+def echo_completeness(completeness):
+    """Print completeness report of deadline-bounded gathering"""
+    click.echo('Deadline: {}/{} issue(s) done, {} page(s) skipped, '
+               '~{:.0%} of comments covered{}'.format(
+        completeness.issues_done, completeness.issues_total,
+        completeness.pages_skipped, completeness.coverage,
+        '' if completeness.search_complete else ' (search incomplete)'
+    ))
 
 
 def setup_info_msgs(supervisor):
@@ -139,6 +173,19 @@ def setup_info_msgs(supervisor):
             supervisor.data['waiting'] = 0
             click.echo('Resuming working after wait')
 
+    def print_hop(hop, frontier):
+        click.echo('Hop {}: expanding {} user(s)...'.format(
+            hop, len(frontier)
+        ))
+
+    def print_round(estimates, requests, pages):
+        click.echo('Sampled {} of {} comment page(s)...'.format(
+            requests, pages
+        ))
+
+    supervisor.callbacks['hop'].append(print_hop)
+    supervisor.callbacks['estimate_round'].append(print_round)
+    supervisor.callbacks['completeness'].append(echo_completeness)
     supervisor.callbacks['issues_search_page'].append(print_count)
     supervisor.callbacks['wait'].append(waiting_phase_change)
     supervisor.callbacks['skip'].append(add_skipped)
@@ -146,6 +193,35 @@ def setup_info_msgs(supervisor):
     supervisor.callbacks['finish_errored'].append(report_skipped)
 
 
+def setup_tracing(supervisor, path):
+    """Setup timeline tracing to given file for given supervisor"""
+    tracer = Tracer()
+
+    def dump_trace():
+        tracer.dump(path)
+        click.echo('Trace saved to {}'.format(path), err=True)
+
+    supervisor.callbacks['finish_successful'].append(dump_trace)
+    supervisor.callbacks['finish_errored'].append(dump_trace)
+    return tracer
+
+
+def setup_profiling(supervisor, path):
+    """Setup profiling to given file for given supervisor"""
+    profiler = Profiler(asyncio.get_event_loop())
+
+    def report_profile():
+        profiler.stop()
+        profiler.dump(path)
+        click.echo(profiler.summary(), err=True)
+        click.echo('Profile saved to {} (and {}.folded)'.format(path, path),
+                   err=True)
+
+    supervisor.callbacks['finish_successful'].insert(0, report_profile)
+    supervisor.callbacks['finish_errored'].insert(0, report_profile)
+    profiler.start()
+
+
 def print_result(result):
     """Print Asya result nicely"""
     if result is None:
@@ -166,6 +242,53 @@ def print_result(result):
         )
 
 
+def print_edges(result):
+    """Print Asya acquaintance graph nicely as weighted edge list"""
+    if result is None:
+        click.secho('Result is None!', fg='red')
+        return
+    elif len(result) == 0:
+        click.echo('No results to print...')
+        return
+    d = sorted(result.items(), key=lambda e: (-e[1], e[0]))
+    swidth = max([len(source) for (source, _), _ in d])
+    twidth = max([len(target) for (_, target), _ in d])
+    cwidth = max([len(str(count)) for _, count in d])
+    for (source, target), count in d:
+        click.echo(
+            '{s:{sw}} -> {t:{tw}} = {c:{cw}}'.format(
+                s=source, sw=swidth,
+                t=target, tw=twidth,
+                c=count, cw=cwidth
+            )
+        )
+
+
+def print_estimates(result):
+    """Print Asya estimates nicely with confidence intervals"""
+    if result is None:
+        click.secho('Result is None!', fg='red')
+        return
+    elif len(result) == 0:
+        click.echo('No results to print...')
+        return
+    d = [(k, result[k]) for k in sorted(result, reverse=True,
+                                        key=lambda u: result[u].count)]
+    d = [(username, [str(round(x)) for x in estimate])
+         for username, estimate in d]
+    uwidth = max([len(username) for username, _ in d])
+    widths = [max([len(e[i]) for _, e in d]) for i in range(3)]
+    for username, (count, low, high) in d:
+        click.echo(
+            '{u:{uw}} ~ {c:{cw}} (95% CI {l:>{lw}}-{h:{hw}})'.format(
+                u=username, uw=uwidth,
+                c=count, cw=widths[0],
+                l=low, lw=widths[1],
+                h=high, hw=widths[2]
+            )
+        )
+
+
 def no_print(*args, **kwargs):
     """Dummy method for not actually printing anything"""
     pass
@@ -194,6 +317,21 @@ def no_print(*args, **kwargs):
               help='Sort search results (important for >1000 results).')
 @click.option('--order', type=click.Choice(['asc', 'desc']),
               help='Sort order of results (important for >1000 results).')
+@click.option('-d', '--depth', type=click.IntRange(1), default=1,
+              help='Number of hops to expand acquaintances (default 1).')
+@click.option('--hop-budget', type=click.IntRange(0), default=None,
+              help='Max number of new issues crawled per hop.')
+@click.option('--max-frontier', type=click.IntRange(1), default=None,
+              help='Max number of users expanded per hop.')
+@click.option('-e', '--estimate', is_flag=True,
+              help='Estimate counts by sampling only some comment pages.')
+@click.option('--top', type=click.IntRange(1), default=None,
+              help='Number of top acquaintances to be decided '
+                   '(estimate, default 10).')
+@click.option('--budget', type=click.IntRange(1), default=None,
+              help='Max number of comment page requests (estimate).')
+@click.option('--deadline', type=click.FloatRange(0), default=None,
+              help='Stop after given seconds with partial results.')
 @click.option('-t', '--token', default=None,
               envvar='GITHUB_TOKEN', help='Personal GitHub token.')
 @click.option('-w', '--wait-rate-limit', is_flag=True,
@@ -206,14 +344,39 @@ def no_print(*args, **kwargs):
               help='Toggle info texts (default true).')
 @click.option('--api-endpoint', default='https://api.github.com',
               help='How is given user involved in issues.')
+@click.option('--transport', type=click.Choice(sorted(TRANSPORTS)),
+              default='aiohttp', help='HTTP transport (http2 needs httpx).')
+@click.option('--trace', type=click.Path(dir_okay=False, writable=True),
+              help='Save timeline trace (Chrome trace-event JSON) to file.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True),
+              help='Profile CPU usage and save pstats to file.')
 @click.option('--debug', is_flag=True, default=False,
               help='Debug mode (not catching other exceptions).')
 @click.version_option('0.1')
 def main(username, token, wait_rate_limit, sort, order, progress_bar, info,
-         skip_404, text, involvement, api_endpoint, debug, **query_opts):
+         skip_404, text, involvement, api_endpoint, debug, depth, hop_budget,
+         max_frontier, trace, estimate, top, budget, deadline, profile,
+         transport, **query_opts):
     """Asya Command Line Interface (via :mod:`click`)"""
-    search_specs = create_search_specs(username, sort, order, text,
-                                       involvement, query_opts)
+    if estimate and depth > 1:
+        raise click.UsageError('Options --estimate and --depth cannot '
+                               'be used together.')
+    if deadline is not None and (estimate or depth > 1):
+        raise click.UsageError('Option --deadline cannot be used with '
+                               '--estimate or --depth.')
+    if depth == 1 and (hop_budget is not None or max_frontier is not None):
+        raise click.UsageError('Options --hop-budget and --max-frontier '
+                               'require --depth greater than 1.')
+    if not estimate and (top is not None or budget is not None):
+        raise click.UsageError('Options --top and --budget require '
+                               '--estimate.')
+    if top is None:
+        top = 10
+
+    def search_specs_for(user):
+        return create_search_specs(user, sort, order, text,
+                                   involvement, dict(query_opts))
+
     supervisor = AsyaSupervisor(api_endpoint, token, wait_rate_limit, skip_404)
 
     print_info = no_print
@@ -222,22 +385,49 @@ def main(username, token, wait_rate_limit, sort, order, progress_bar, info,
         setup_progressbar(supervisor)
     elif info:
         setup_info_msgs(supervisor)
+    if profile is not None:
+        setup_profiling(supervisor, profile)
     if info:
         print_info = click.secho
+    tracer = None
+    if trace is not None:
+        tracer = setup_tracing(supervisor, trace)
+
+    if estimate:
+        printer = print_estimates
+
+        def gather():
+            return estimate_acquaintances(search_specs_for(username),
+                                          supervisor, top, budget,
+                                          transport=transport, tracer=tracer)
+    elif depth > 1:
+        printer = print_edges
+
+        def gather():
+            return gather_acquaintance_graph(username, search_specs_for,
+                                             depth, supervisor, hop_budget,
+                                             max_frontier, transport, tracer)
+    else:
+        printer = print_result
+
+        def gather():
+            return gather_acquaintances(search_specs_for(username),
+                                        supervisor, deadline, transport,
+                                        tracer)
 
     if debug:
-        result = gather_acquaintances(search_specs, supervisor)
+        result = gather()
         supervisor.report_finish_successful()
         print_info('Asya gathered acquaintances successfully:',
                    fg='green', bold=True, err=True)
-        print_result(result)
+        printer(result)
     else:
         try:
-            result = gather_acquaintances(search_specs, supervisor)
+            result = gather()
             supervisor.report_finish_successful()
             print_info('Asya gathered acquaintances successfully:',
                        fg='green', bold=True, err=True)
-            print_result(result)
+            printer(result)
         except AsyaException as err:
             supervisor.report_finish_errored()
             print_info('Asya ended with communication error:',
@@ -0,0 +1,247 @@
+import asyncio
+import math
+import random
+from collections import Counter, namedtuple
+
+from .logic import create_session, fetch_comment_page, process_search
+from .tracing import activated, active_tracer
+
+
+Estimate = namedtuple('Estimate', ['count', 'low', 'high'])
+Estimate.__doc__ = """Estimated number of comments with confidence interval"""
+
+Z_95 = 1.96
+
+
+class Stratum:
+    """
+    Group of comment pages of issues with similar number of comments
+    sampled by simple random sampling without replacement
+
+    :ivar pages: list of not yet sampled pages as (issue, page) tuples
+    :ivar total: number of all pages in the stratum
+    :ivar samples: list of sampled pages as Counters of comment authors
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.total = 0
+        self.samples = []
+
+    def add_issue(self, issue, per_page):
+        npages = math.ceil(issue['comments'] / per_page)
+        self.pages.extend((issue, page) for page in range(1, npages + 1))
+        self.total += npages
+
+    def estimate(self, user):
+        """
+        Estimate total number of comments of user in this stratum
+
+        :return: tuple of estimated count and its variance
+        :rtype: tuple
+        """
+        n = len(self.samples)
+        if n == 0:
+            return 0.0, 0.0
+        values = [sample[user] for sample in self.samples]
+        mean = sum(values) / n
+        if n == self.total:
+            return mean * n, 0.0
+        if n == 1:
+            variance = mean ** 2  # unknown spread, be conservative
+        else:
+            variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+        correction = 1 - n / self.total
+        return self.total * mean, \
+            self.total ** 2 * correction * variance / n
+
+
+def stratum_key(issue):
+    """Stratum of the issue by order of magnitude of its comments"""
+    return int(issue['comments']).bit_length()
+
+
+def compute_estimates(strata, observed):
+    """
+    Combine estimates from strata for all observed users
+
+    :param strata: list of strata
+    :type strata: list
+    :param observed: numbers of comments seen in samples by usernames
+    :type observed: collections.Counter
+    :return: dictionary with usernames as keys and estimates as values
+    :rtype: dict
+    """
+    estimates = {}
+    for user, seen in observed.items():
+        count, variance = 0.0, 0.0
+        for stratum in strata:
+            c, v = stratum.estimate(user)
+            count += c
+            variance += v
+        error = Z_95 * math.sqrt(variance)
+        estimates[user] = Estimate(count, max(seen, count - error),
+                                   count + error)
+    return estimates
+
+
+def allocate(strata, size):
+    """
+    Pick pages to be sampled (proportionally to strata sizes, but
+    at least two pages from each stratum first)
+
+    :return: list of (stratum, issue, page) tuples
+    :rtype: list
+    """
+    picked = []
+    taken = Counter()
+    for _ in range(size):
+        candidates = [s for s in strata if len(s.pages) > taken[s]]
+        if len(candidates) == 0:
+            break
+        stratum = min(candidates, key=lambda s: (
+            len(s.samples) + taken[s] >= min(2, s.total),
+            (len(s.samples) + taken[s]) / s.total
+        ))
+        taken[stratum] += 1
+        picked.append(stratum)
+    return [(stratum, ) + stratum.pages.pop() for stratum in picked]
+
+
+def ranking(estimates, top):
+    """Set of usernames with ``top`` highest estimated counts"""
+    return frozenset(sorted(estimates,
+                            key=lambda u: (-estimates[u].count, u))[:top])
+
+
+def separated(estimates, top):
+    """Whether confidence intervals of ``top`` acquaintances are all
+    above intervals of the others (so the top set is decided)"""
+    ranked = sorted(estimates.values(), key=lambda e: -e.count)
+    if len(ranked) <= top:
+        return False
+    return min(e.low for e in ranked[:top]) > \
+        max(e.high for e in ranked[top:])
+
+
+async def estimate_acquaintances_async(search_specs, supervisor, top=10,
+                                       budget=None, batch_size=50,
+                                       stable_rounds=3, seed=None,
+                                       session=None, transport='aiohttp',
+                                       tracer=None):
+    """Coroutine variant of :func:`estimate_acquaintances`.
+
+    :param session: HTTP session to be reused (new one is created if None)
+    :type session: asya.transport.Transport
+    """
+    rng = random.Random(seed)
+    issues = []
+    strata = {}
+    observed = Counter()
+    supervisor.obj = {'estimates': {}, 'requests': 0, 'pages': 0}
+    search_specs['per_page'] = supervisor.per_page
+
+    async def collect(issue):
+        issues.append(issue)
+
+    async def sample(session):
+        await process_search(session, supervisor, search_specs, collect)
+        for issue in issues:
+            if issue['comments'] > 0:
+                key = stratum_key(issue)
+                strata.setdefault(key, Stratum())
+                strata[key].add_issue(issue, supervisor.per_page)
+        for stratum in strata.values():
+            rng.shuffle(stratum.pages)
+        supervisor.obj['pages'] = sum(s.total for s in strata.values())
+
+        last_ranking, stable = None, 0
+        while stable < stable_rounds:
+            size = batch_size
+            if budget is not None:
+                size = min(size, budget - supervisor.obj['requests'])
+            picked = allocate(list(strata.values()), size)
+            if len(picked) == 0:
+                break
+            with active_tracer().span('sample_round', 'crawl',
+                                      pages=len(picked)):
+                results = await asyncio.gather(*[
+                    asyncio.ensure_future(
+                        fetch_comment_page(session, supervisor, issue, page)
+                    ) for _, issue, page in picked
+                ])
+            for (stratum, _, _), counts in zip(picked, results):
+                stratum.samples.append(counts)
+                observed.update(counts)
+            supervisor.obj['requests'] += len(picked)
+            estimates = compute_estimates(strata.values(), observed)
+            supervisor.obj['estimates'] = estimates
+            with active_tracer().span('report_estimate_round', 'callback'):
+                supervisor.report_estimate_round(estimates,
+                                                 supervisor.obj['requests'],
+                                                 supervisor.obj['pages'])
+            if separated(estimates, top):
+                break
+            current = ranking(estimates, top)
+            stable = stable + 1 if current == last_ranking else 0
+            last_ranking = current
+
+    with activated(tracer):
+        if session is not None:
+            await sample(session)
+        else:
+            async with create_session(supervisor, transport) as session:
+                await sample(session)
+
+    return supervisor.obj['estimates']
+
+
+def estimate_acquaintances(search_specs, supervisor, top=10, budget=None,
+                           batch_size=50, stable_rounds=3, seed=None,
+                           transport='aiohttp', tracer=None):
+    """Estimate acquaintances from GitHub issues matching given
+    search_specs by sampling only a fraction of comment pages.
+
+    Comment pages are grouped into strata by number of comments of
+    their issue and sampled in rounds of ``batch_size`` requests until
+    confidence intervals separate ``top`` acquaintances from the others,
+    the set of ``top`` acquaintances does not change for
+    ``stable_rounds`` rounds, the ``budget`` of comment page requests
+    is spent or all pages are sampled (then the counts are exact).
+
+    >>> estimate_acquaintances({'q': 'author:MarekSuchanek'}, supervisor)
+    {'hroncok': Estimate(count=15.0, low=12.1, high=17.9), ...}
+
+    :param search_specs: dictionary with search specification (params for the search)
+    :type search_specs: dict
+    :param supervisor: supervisor object used for this gathering
+    :type supervisor: asya.supervisor.AsyaSupervisor
+    :param top: number of top acquaintances to be decided
+    :type top: int
+    :param budget: max number of comment page requests (None for no limit)
+    :type budget: int
+    :param batch_size: number of concurrent requests in single round
+    :type batch_size: int
+    :param stable_rounds: number of rounds with unchanged top set to stop
+    :type stable_rounds: int
+    :param seed: seed for random sampling
+    :type seed: int
+    :param transport: name of HTTP transport
+                      (see :data:`asya.transport.TRANSPORTS`)
+    :type transport: str
+    :param tracer: tracer recording timeline spans (None for no tracing)
+    :type tracer: asya.tracing.Tracer
+
+    :return: dictionary with usernames as keys and
+             :class:`Estimate` (with 95% confidence interval) as values
+    :rtype: dict
+    """
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(
+        estimate_acquaintances_async(search_specs, supervisor, top, budget,
+                                     batch_size, stable_rounds, seed,
+                                     transport=transport, tracer=tracer)
+    )
+    loop.close()
+
+    return result
@@ -1,12 +1,21 @@
 import asyncio
-import async_timeout
+import math
 import time
+from collections import Counter, defaultdict, deque, namedtuple
 
-import aiohttp
 import requests
 from urllib.parse import urlparse, parse_qs
 
 from .exceptions import AsyaException
+from .tracing import activated, active_tracer
+from .transport import TRANSPORTS
+
+
+Completeness = namedtuple('Completeness', [
+    'issues_done', 'issues_total', 'pages_done', 'pages_skipped',
+    'coverage', 'search_complete'
+])
+Completeness.__doc__ = """Report how complete deadline-bounded gathering is"""
 
 
 class GitHubHeaders:
@@ -46,26 +55,28 @@ def get_last_page(headers):
 
 
 async def fetch_data_header(session, url, params=None):
-    with async_timeout.timeout(10):
-        async with session.get(url, headers=session.headers,
-                               params=params) as response:
-            return await response.json(), response.headers
+    return await asyncio.wait_for(session.get(url, params), 10)
 
 
 async def fetch_and_process(supervisor, session, url, processor, params=None,
                             expected_code=200):
-    data, headers = await fetch_data_header(session, url, params)
+    with active_tracer().span('fetch', 'http', url=url, params=params):
+        data, headers = await fetch_data_header(session, url, params)
 
     gheaders = GitHubHeaders(headers)
     if gheaders.status_code != expected_code:
         if gheaders.status_code == 404 and supervisor.skip_404:
-            supervisor.report_skip(headers)
+            with active_tracer().span('report_skip', 'callback'):
+                supervisor.report_skip(headers)
             return None
 
         if gheaders.ratelimit_exhausted and supervisor.wait_rate_limit:
-            supervisor.report_wait(True, headers)
-            await asyncio.sleep(gheaders.ratelimit_wait)
-            supervisor.report_wait(False, headers)
+            with active_tracer().span('report_wait', 'callback'):
+                supervisor.report_wait(True, headers)
+            with active_tracer().span('rate_limit_wait', 'wait'):
+                await asyncio.sleep(gheaders.ratelimit_wait)
+            with active_tracer().span('report_wait', 'callback'):
+                supervisor.report_wait(False, headers)
             return await fetch_and_process(supervisor, session, url,
                                            processor, params, expected_code)
 
@@ -74,7 +85,8 @@ async def fetch_and_process(supervisor, session, url, processor, params=None,
 
 
 async def process_comment(supervisor, comment):
-    supervisor.report_comment(comment)
+    with active_tracer().span('report_comment', 'callback'):
+        supervisor.report_comment(comment)
 
 
 async def process_pages(session, supervisor, url, params, process_item):
@@ -89,8 +101,9 @@ async def process_pages(session, supervisor, url, params, process_item):
                 ]
                 await asyncio.gather(*futures)
 
-            await fetch_and_process(supervisor, session, url,
-                                    process_data, xparams)
+            with active_tracer().span('comment_page', 'crawl', page=page):
+                await fetch_and_process(supervisor, session, url,
+                                        process_data, xparams)
 
         futures = [asyncio.ensure_future(process_item(item)) for item in data]
 
@@ -101,69 +114,241 @@ async def process_pages(session, supervisor, url, params, process_item):
 
         await asyncio.gather(*futures)
 
-    await fetch_and_process(supervisor, session, url, process, params)
+    with active_tracer().span('comment_page', 'crawl', page=1):
+        await fetch_and_process(supervisor, session, url, process, params)
 
 
 async def process_issue(session, supervisor, issue):
     async def process(comment):
         await process_comment(supervisor, comment)
 
-    await process_pages(
-        session,
-        supervisor,
-        issue['comments_url'],
-        {'per_page': supervisor.per_page},
-        process
-    )
-    supervisor.report_issue(issue)
-
-
-async def gather_acquaintances_from_issues(search_specs, supervisor):
+    with active_tracer().span('issue', 'crawl', url=issue['url']):
+        await process_pages(
+            session,
+            supervisor,
+            issue['comments_url'],
+            {'per_page': supervisor.per_page},
+            process
+        )
+        with active_tracer().span('report_issue', 'callback'):
+            supervisor.report_issue(issue)
+
+
+async def fetch_comment_page(session, supervisor, issue, page):
+    counts = Counter()
+
+    async def process(data, _):
+        for comment in data:
+            counts[comment['user']['login']] += 1
+            with active_tracer().span('report_comment', 'callback'):
+                supervisor.report_comment(comment)
+
+    params = {'page': page, 'per_page': supervisor.per_page}
+    with active_tracer().span('comment_page', 'crawl', page=page):
+        await fetch_and_process(supervisor, session, issue['comments_url'],
+                                process, params)
+    return counts
+
+
+def create_session(supervisor, transport='aiohttp'):
+    """Create HTTP transport of given name (see :mod:`asya.transport`)
+    with headers for given supervisor"""
+    headers = {'User-Agent': 'Python/ASYA'}
+    if supervisor.has_token:
+        headers['Authorization'] = 'token ' + supervisor.token
+    return TRANSPORTS[transport](headers)
+
+
+async def process_search(session, supervisor, search_specs,
+                         process_item=None):
     url = supervisor.api_endpoint + '/search/issues'
-    async with aiohttp.ClientSession() as session:
-        session.headers = {'User-Agent': 'Python/ASYA'}
-        if supervisor.has_token:
-            session.headers['Authorization'] = 'token ' + supervisor.token
 
+    if process_item is None:
         async def process_item(issue):
             await process_issue(session, supervisor, issue)
 
-        async def process_page(data, _, page):
+    async def process_page(data, _, page):
+        with active_tracer().span('report_issues_search_page', 'callback'):
             supervisor.report_issues_search_page(data, page)
-            futures = [asyncio.ensure_future(process_item(item))
-                       for item in data['items']]
-            await asyncio.gather(*futures)
+        futures = [asyncio.ensure_future(process_item(item))
+                   for item in data['items']]
+        await asyncio.gather(*futures)
 
-        async def process_query_page(page):
-            params = {'page': page}
-            params.update(search_specs)
+    async def process_query_page(page):
+        params = {'page': page}
+        params.update(search_specs)
 
-            async def process_data(data, headers):
-                await process_page(data, headers, page)
+        async def process_data(data, headers):
+            await process_page(data, headers, page)
 
+        with active_tracer().span('search_page', 'crawl', page=page):
             await fetch_and_process(supervisor, session, url,
                                     process_data, params)
 
-        async def process(data, headers):
-            futures = [asyncio.ensure_future(process_page(data, headers, 1))]
+    async def process(data, headers):
+        futures = [asyncio.ensure_future(process_page(data, headers, 1))]
 
-            if 'Link' in headers:
-                last_page = get_last_page(headers)
-                for page in range(2, last_page + 1):
-                    futures.append(asyncio.ensure_future(
-                        process_query_page(page))
-                    )
+        if 'Link' in headers:
+            last_page = get_last_page(headers)
+            for page in range(2, last_page + 1):
+                futures.append(asyncio.ensure_future(
+                    process_query_page(page))
+                )
 
-            await asyncio.gather(*futures)
+        await asyncio.gather(*futures)
 
+    with active_tracer().span('search_page', 'crawl', page=1):
         await fetch_and_process(supervisor, session, url,
                                 process, search_specs)
 
 
-def gather_acquaintances(search_specs, supervisor):
+async def process_search_until(session, supervisor, search_specs, deadline,
+                               concurrency=50):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + deadline
+    issues = []
+
+    async def collect(issue):
+        issues.append(issue)
+
+    search_complete = True
+    try:
+        await asyncio.wait_for(
+            process_search(session, supervisor, search_specs, collect),
+            deadline
+        )
+    except asyncio.TimeoutError:
+        search_complete = False
+
+    # pages with most comments per request first (last page is partial)
+    pages = []
+    remaining = {}
+    for issue in issues:
+        npages = math.ceil(issue['comments'] / supervisor.per_page)
+        remaining[issue['url']] = npages
+        if npages == 0:
+            with active_tracer().span('report_issue', 'callback'):
+                supervisor.report_issue(issue)
+        for page in range(1, npages + 1):
+            size = min(supervisor.per_page,
+                       issue['comments'] - (page - 1) * supervisor.per_page)
+            pages.append((size, issue, page))
+    pages = deque(sorted(pages, key=lambda p: -p[0]))
+    progress = {'pages': 0, 'comments': 0}
+
+    async def worker():
+        while len(pages) > 0 and loop.time() < end:
+            _, issue, page = pages.popleft()
+            counts = await fetch_comment_page(session, supervisor,
+                                              issue, page)
+            progress['pages'] += 1
+            progress['comments'] += sum(counts.values())
+            remaining[issue['url']] -= 1
+            if remaining[issue['url']] == 0:
+                with active_tracer().span('report_issue', 'callback'):
+                    supervisor.report_issue(issue)
+
+    with active_tracer().span('comment_pages', 'crawl', pages=len(pages)):
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(concurrency)]
+        done, pending = await asyncio.wait(
+            workers, timeout=max(0, end - loop.time()),
+            return_when=asyncio.FIRST_EXCEPTION
+        )
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    for future in done:
+        future.result()
+
+    total = sum(issue['comments'] for issue in issues)
+    npages = sum(math.ceil(issue['comments'] / supervisor.per_page)
+                 for issue in issues)
+    completeness = Completeness(
+        issues_done=sum(1 for n in remaining.values() if n == 0),
+        issues_total=len(issues),
+        pages_done=progress['pages'],
+        pages_skipped=npages - progress['pages'],
+        coverage=progress['comments'] / total if total > 0
+        else 1.0 if search_complete else 0.0,
+        search_complete=search_complete
+    )
+    supervisor.obj['completeness'] = completeness
+    with active_tracer().span('report_completeness', 'callback'):
+        supervisor.report_completeness(completeness)
+
+
+async def gather_acquaintances_from_issues(search_specs, supervisor,
+                                           session=None, deadline=None,
+                                           transport='aiohttp'):
+    async def process(session):
+        if deadline is None:
+            await process_search(session, supervisor, search_specs)
+        else:
+            await process_search_until(session, supervisor, search_specs,
+                                       deadline)
+
+    if session is not None:
+        await process(session)
+        return
+    async with create_session(supervisor, transport) as session:
+        await process(session)
+
+
+async def gather_acquaintances_async(search_specs, supervisor, session=None,
+                                     deadline=None, transport='aiohttp',
+                                     tracer=None):
+    """Coroutine variant of :func:`gather_acquaintances` for callers
+    that already run an event loop (e.g. :mod:`asya.server`).
+
+    :param search_specs: dictionary with search specification (params for the search)
+    :type search_specs: dict
+    :param supervisor: supervisor object used for this gathering
+    :type supervisor: asya.supervisor.AsyaSupervisor
+    :param session: HTTP session to be reused (new one is created if None)
+    :type session: asya.transport.Transport
+    :param deadline: number of seconds for gathering (None for no limit)
+    :type deadline: float
+    :param transport: name of HTTP transport used if session is None
+                      (see :data:`asya.transport.TRANSPORTS`)
+    :type transport: str
+    :param tracer: tracer recording timeline spans (None for no tracing)
+    :type tracer: asya.tracing.Tracer
+
+    :return: dictionary with usernames as keys and number of comments as values
+    :rtype: dict
+    """
+    supervisor.obj = {'counts': defaultdict(int)}
+
+    search_specs['per_page'] = supervisor.per_page
+
+    def add_comment(comment):
+        supervisor.obj['counts'][comment['user']['login']] += 1
+
+    supervisor.callbacks['comment'].append(add_comment)
+    try:
+        with activated(tracer):
+            await gather_acquaintances_from_issues(search_specs, supervisor,
+                                                   session, deadline,
+                                                   transport)
+    finally:
+        supervisor.callbacks['comment'].remove(add_comment)
+
+    return supervisor.obj['counts']
+
+
+def gather_acquaintances(search_specs, supervisor, deadline=None,
+                         transport='aiohttp', tracer=None):
     """Gather acquaintances from GitHub issues and comments with
     given search_specs with counts of comments in form of dict.
-    It uses :mod:`asyncio` and :class:`aiohttp.ClientSession`.
+    It uses :mod:`asyncio` and :class:`~asya.transport.Transport`
+    selected by ``transport`` (:mod:`aiohttp` by default).
+
+    With ``deadline``, issues are searched first and then their comment
+    pages are fetched (the ones with most comments per request first)
+    until the deadline when in-flight requests are cancelled. Partial
+    counts are returned and :class:`Completeness` is reported via
+    ``supervisor.report_completeness`` (and stored in ``supervisor.obj``).
 
     >>> gather_acquaintances({'q': 'author:MarekSuchanek'}, supervisor)
     {'MarekSuchanek': 7, 'hroncok': 15, 'encukou': 10}
@@ -175,26 +360,163 @@ def gather_acquaintances(search_specs, supervisor):
     :type search_specs: dict
     :param supervisor: supervisor object used for this gathering
     :type supervisor: asya.supervisor.AsyaSupervisor
+    :param deadline: number of seconds for gathering (None for no limit)
+    :type deadline: float
+    :param transport: name of HTTP transport
+                      (see :data:`asya.transport.TRANSPORTS`)
+    :type transport: str
+    :param tracer: tracer recording timeline spans (None for no tracing)
+    :type tracer: asya.tracing.Tracer
 
     :return: dictionary with usernames as keys and number of comments as values
     :rtype: dict
     """
-    # return {}
-    from collections import defaultdict
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(
+        gather_acquaintances_async(search_specs, supervisor,
+                                   deadline=deadline, transport=transport,
+                                   tracer=tracer)
+    )
+    loop.close()
+
+    return result
 
-    supervisor.obj = {'counts': defaultdict(int)}
 
+async def count_issue_comments(session, supervisor, issue):
+    counts = Counter()
+
+    async def process(comment):
+        counts[comment['user']['login']] += 1
+        await process_comment(supervisor, comment)
+
+    with active_tracer().span('issue', 'crawl', url=issue['url']):
+        await process_pages(
+            session,
+            supervisor,
+            issue['comments_url'],
+            {'per_page': supervisor.per_page},
+            process
+        )
+        with active_tracer().span('report_issue', 'callback'):
+            supervisor.report_issue(issue)
+    return counts
+
+
+async def expand_acquaintances(session, supervisor, username,
+                               search_specs_for, hop_budget):
+    issues = supervisor.obj['issues']
+    edges = supervisor.obj['edges']
+
+    async def process_item(issue):
+        key = issue['url']
+        if key in issues:
+            with active_tracer().span('report_issue_reused', 'callback'):
+                supervisor.report_issue_reused(issue)
+        elif hop_budget is not None and supervisor.obj['budget'] <= 0:
+            with active_tracer().span('report_issue_over_budget', 'callback'):
+                supervisor.report_issue_over_budget(issue)
+            return
+        else:
+            if hop_budget is not None:
+                supervisor.obj['budget'] -= 1
+            issues[key] = asyncio.ensure_future(
+                count_issue_comments(session, supervisor, issue)
+            )
+        counts = await issues[key]
+        for login, count in counts.items():
+            if login != username:
+                edges[(username, login)] += count
+
+    search_specs = search_specs_for(username)
     search_specs['per_page'] = supervisor.per_page
+    await process_search(session, supervisor, search_specs, process_item)
 
-    def add_comment(comment):
-        supervisor.obj['counts'][comment['user']['login']] += 1
 
-    supervisor.callbacks['comment'].append(add_comment)
+async def gather_acquaintance_graph_async(username, search_specs_for, depth,
+                                          supervisor, hop_budget=None,
+                                          max_frontier=None, session=None,
+                                          transport='aiohttp', tracer=None):
+    """Coroutine variant of :func:`gather_acquaintance_graph`.
 
+    :param session: HTTP session to be reused (new one is created if None)
+    :type session: asya.transport.Transport
+    """
+    supervisor.obj = {'edges': defaultdict(int), 'issues': {}, 'budget': 0}
+    edges = supervisor.obj['edges']
+
+    async def expand(session):
+        visited = {username}
+        frontier = [username]
+        for hop in range(1, depth + 1):
+            if len(frontier) == 0:
+                break
+            with active_tracer().span('report_hop', 'callback'):
+                supervisor.report_hop(hop, frontier)
+            supervisor.obj['budget'] = hop_budget
+            await asyncio.gather(*[
+                asyncio.ensure_future(expand_acquaintances(
+                    session, supervisor, user, search_specs_for, hop_budget
+                )) for user in frontier
+            ])
+            expanded = set(frontier)
+            weights = defaultdict(int)
+            for (source, target), weight in edges.items():
+                if source in expanded and target not in visited:
+                    weights[target] += weight
+            frontier = sorted(weights, key=lambda u: (-weights[u], u))
+            frontier = frontier[:max_frontier]
+            visited.update(frontier)
+
+    with activated(tracer):
+        if session is not None:
+            await expand(session)
+        else:
+            async with create_session(supervisor, transport) as session:
+                await expand(session)
+
+    return supervisor.obj['edges']
+
+
+def gather_acquaintance_graph(username, search_specs_for, depth, supervisor,
+                              hop_budget=None, max_frontier=None,
+                              transport='aiohttp', tracer=None):
+    """Gather weighted acquaintance graph by breadth-first expansion
+    from given user, where each discovered acquaintance is searched
+    again in the next hop (up to ``depth`` hops). Each issue is crawled
+    only once no matter how many users' searches contain it.
+
+    >>> gather_acquaintance_graph('MarekSuchanek', specs_for, 2, supervisor)
+    {('MarekSuchanek', 'hroncok'): 15, ('hroncok', 'encukou'): 42}
+
+    :param username: GitHub username to start the expansion from
+    :type username: str
+    :param search_specs_for: function creating search specs for username
+    :type search_specs_for: callable
+    :param depth: number of hops to expand (1 for direct acquaintances)
+    :type depth: int
+    :param supervisor: supervisor object used for this gathering
+    :type supervisor: asya.supervisor.AsyaSupervisor
+    :param hop_budget: max number of new issues crawled per hop (None for no limit)
+    :type hop_budget: int
+    :param max_frontier: max number of users expanded per hop, the most
+                         weighted are preferred (None for no limit)
+    :type max_frontier: int
+    :param transport: name of HTTP transport
+                      (see :data:`asya.transport.TRANSPORTS`)
+    :type transport: str
+    :param tracer: tracer recording timeline spans (None for no tracing)
+    :type tracer: asya.tracing.Tracer
+
+    :return: dictionary with (user, acquaintance) tuples as keys and
+             number of comments of acquaintance as values
+    :rtype: dict
+    """
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(
-        gather_acquaintances_from_issues(search_specs, supervisor)
+    result = loop.run_until_complete(
+        gather_acquaintance_graph_async(username, search_specs_for, depth,
+                                        supervisor, hop_budget, max_frontier,
+                                        transport=transport, tracer=tracer)
     )
     loop.close()
 
-    return supervisor.obj['counts']
+    return result
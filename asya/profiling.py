@@ -0,0 +1,262 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import types
+from collections import Counter
+
+from .estimation import Stratum, compute_estimates
+from .logic import GitHubHeaders, count_issue_comments, \
+    expand_acquaintances, fetch_comment_page, gather_acquaintances_async, \
+    get_last_page
+from .supervisor import AsyaSupervisor
+
+
+def _code_keys(*objects, nested=None):
+    """pstats keys of given functions and functions nested in them
+    (only nested functions with given name if ``nested`` is set)"""
+    keys = set()
+    codes = []
+    for obj in objects:
+        if isinstance(obj, property):
+            obj = obj.fget
+        codes.append(getattr(obj, '__code__', None))
+    while codes:
+        code = codes.pop()
+        if not isinstance(code, types.CodeType):
+            continue
+        if nested is None or code.co_name == nested:
+            keys.add((code.co_filename, code.co_firstlineno, code.co_name))
+        codes.extend(code.co_consts)
+    return keys
+
+
+def _is_progress_render(key):
+    return key[0].endswith('_termui_impl.py') and key[2] == 'render_progress'
+
+
+_SELECTOR_WAITS = ("'poll' of 'select.", "'control' of 'select.kqueue'",
+                   'select.select', 'GetQueuedCompletionStatus')
+
+
+def _is_selector_wait(key):
+    """Whether the pstats key is event loop waiting for I/O"""
+    filename, _, name = key
+    if filename == '~':
+        return any(wait in name for wait in _SELECTOR_WAITS)
+    return filename.endswith('selectors.py') and name == 'select'
+
+
+#: Categories of the report as (name, matcher, inclusive) tuples, where
+#: inclusive categories count cumulative and others only own time
+CATEGORIES = (
+    ('JSON decoding', _code_keys(json.loads).__contains__, True),
+    ('GitHubHeaders parsing', _code_keys(
+        get_last_page, *vars(GitHubHeaders).values()
+    ).__contains__, True),
+    ('supervisor dispatch', _code_keys(
+        AsyaSupervisor._do_callback, AsyaSupervisor.__getattr__
+    ).__contains__, False),
+    ('progress bar rendering', _is_progress_render, True),
+    ('aggregation', (
+        _code_keys(gather_acquaintances_async, nested='add_comment') |
+        _code_keys(fetch_comment_page, nested='process') |
+        _code_keys(count_issue_comments, nested='process') |
+        _code_keys(expand_acquaintances, nested='process_item') |
+        _code_keys(compute_estimates, Stratum.estimate)
+    ).__contains__, False),
+)
+
+
+class LoopWatchdog(threading.Thread):
+    """
+    Thread detecting callbacks blocking the event loop: the loop
+    updates heartbeat regularly and when it is late for more than
+    ``threshold`` seconds, stack of the loop thread is captured.
+    (Unlike :mod:`asyncio` debug mode, this does not slow down the loop.)
+
+    :ivar stalls: list of [seconds, stack] lists of detected stalls
+    """
+
+    def __init__(self, loop, threshold):
+        super().__init__(daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.loop_thread = threading.get_ident()
+        self.beat = None
+        self.stalls = []
+        self.stopped = threading.Event()
+
+    def heartbeat(self):
+        self.beat = time.monotonic()
+        if not self.stopped.is_set():
+            self.loop.call_later(self.interval, self.heartbeat)
+
+    def start(self):
+        self.loop.call_soon(self.heartbeat)
+        super().start()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        stalled_beat = None
+        while not self.stopped.wait(self.interval / 2):
+            beat = self.beat
+            if beat is None or not self.loop.is_running():
+                continue
+            late = time.monotonic() - beat - self.interval
+            if late <= self.threshold:
+                continue
+            if beat != stalled_beat:
+                frame = sys._current_frames().get(self.loop_thread)
+                stack = traceback.format_stack(frame, limit=8)
+                self.stalls.append([late, ''.join(stack)])
+                stalled_beat = beat
+            self.stalls[-1][0] = late
+
+
+def _label(key):
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return '{} ({}:{})'.format(name, os.path.basename(filename), line)
+
+
+class Profiler:
+    """
+    Profiler of the gathering (via :mod:`cProfile`, time of the event
+    loop waiting for I/O in its selector is left out) which also
+    watches for callbacks blocking the event loop for longer
+    than ``slow_callback`` seconds (see :class:`LoopWatchdog`).
+
+    .. code ::
+
+       profiler = Profiler(asyncio.get_event_loop())
+       profiler.start()
+       ...  # gathering
+       profiler.stop()
+       print(profiler.summary())
+       profiler.dump('asya.prof')  # and asya.prof.folded
+
+    :ivar profile: the :class:`cProfile.Profile` object
+    :ivar watchdog: the :class:`LoopWatchdog` detecting slow callbacks
+    """
+
+    def __init__(self, loop, slow_callback=0.1):
+        self.slow_callback = slow_callback
+        self.profile = cProfile.Profile()
+        self.watchdog = LoopWatchdog(loop, slow_callback)
+        self.stats = None
+
+    def start(self):
+        """Start profiling and slow callback detection"""
+        self.watchdog.start()
+        self.profile.enable()
+
+    def stop(self):
+        """Stop profiling and slow callback detection"""
+        self.profile.disable()
+        self.watchdog.stop()
+        self.stats = {key: value for key, value
+                      in pstats.Stats(self.profile).stats.items()
+                      if not _is_selector_wait(key)}
+
+    def categories(self):
+        """
+        Split profiled time by categories of the hot path
+
+        :return: list of (category, seconds) tuples
+        :rtype: list
+        """
+        result = []
+        for name, matches, inclusive in CATEGORIES:
+            seconds = 0.0
+            for key, (_, _, tt, ct, _) in self.stats.items():
+                if matches(key):
+                    seconds += ct if inclusive else tt
+            result.append((name, seconds))
+        return result
+
+    def summary(self, top=15):
+        """
+        Create ranked text summary of the profile
+
+        :param top: number of functions with most own time listed
+        :type top: int
+        :return: summary text
+        :rtype: str
+        """
+        total = sum(s[2] for s in self.stats.values()) or 1.0
+        lines = ['Profiled time (without I/O wait): {:.3f}s'.format(total), '']
+        for name, seconds in sorted(self.categories(), key=lambda c: -c[1]):
+            lines.append('{:>6.1%} {:>8.3f}s  {}'.format(
+                seconds / total, seconds, name
+            ))
+        lines.extend(['', 'Top functions by own time:'])
+        ranked = sorted(self.stats.items(), key=lambda s: -s[1][2])[:top]
+        for key, (_, nc, tt, ct, _) in ranked:
+            lines.append('{:>6.1%} {:>8.3f}s {:>8} calls  {}'.format(
+                tt / total, tt, nc, _label(key)
+            ))
+        stalls = sorted(self.watchdog.stalls, key=lambda s: -s[0])
+        lines.extend(['', '{} slow callback(s) blocking the loop '
+                          'over {:.3f}s'.format(len(stalls),
+                                                self.slow_callback)])
+        for late, stack in stalls[:3]:
+            lines.append('Blocked for {:.3f}s in:'.format(late))
+            lines.append(stack.rstrip())
+        return '\n'.join(lines)
+
+    def collapsed_stacks(self, max_depth=64, precision=1e-4):
+        """
+        Create collapsed stacks (for flamegraph tools) from the profile,
+        own time of each function is split among its callers by the
+        numbers of calls (so the stacks are approximate)
+
+        :param max_depth: max depth of the stacks
+        :type max_depth: int
+        :param precision: fraction of total time under which paths are cut
+        :type precision: float
+        :return: microseconds by collapsed stack strings
+        :rtype: collections.Counter
+        """
+        stacks = Counter()
+        total = sum(s[2] for s in self.stats.values())
+        threshold = total * precision
+
+        def walk(key, path, weight):
+            callers = {k: v for k, v in self.stats[key][4].items()
+                       if k not in path and k in self.stats}
+            calls = sum(v[0] for v in callers.values())
+            if calls == 0 or len(path) >= max_depth or weight < threshold:
+                stack = ';'.join(_label(k) for k in reversed(path))
+                stacks[stack] += int(weight * 1e6)
+                return
+            for caller, value in callers.items():
+                walk(caller, path + (caller, ), weight * value[0] / calls)
+
+        for key, (_, _, tt, _, _) in self.stats.items():
+            if tt > 0:
+                walk(key, (key, ), tt)
+        return stacks
+
+    def dump(self, path):
+        """
+        Save the profile as pstats file and collapsed stacks
+        to the same path with ``.folded`` suffix
+
+        :param path: path of the pstats output file
+        :type path: str
+        """
+        self.profile.dump_stats(path)
+        with open(path + '.folded', 'w') as f:
+            for stack, micros in sorted(self.collapsed_stacks().items()):
+                if micros > 0:
+                    f.write('{} {}\n'.format(stack, micros))
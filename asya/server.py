@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import click
+from aiohttp import web
+
+from .cli import create_search_specs, _user_involvement
+from .exceptions import AsyaException
+from .logic import create_session, gather_acquaintances_async
+from .supervisor import AsyaSupervisor
+from .transport import TRANSPORTS, TRANSPORT_ERRORS
+
+
+logger = logging.getLogger(__name__)
+
+_query_opts = ('in', 'type', 'state', 'created', 'updated',
+               'label', 'language')
+
+
+class ResultCache:
+    """
+    LRU cache of gathered results where each entry is fresh only
+    for ``ttl`` seconds (stale entries are kept until evicted)
+
+    :ivar maxsize: maximal number of cached entries
+    :ivar ttl: number of seconds while the entry is considered fresh
+    """
+
+    def __init__(self, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Get cached entry (and mark it as recently used)
+
+        :param key: key of the entry
+        :return: tuple of value and freshness flag or None if not cached
+        :rtype: tuple
+        """
+        if key not in self.entries:
+            return None
+        value, stored = self.entries.pop(key)
+        self.entries[key] = (value, stored)
+        return value, time.monotonic() - stored < self.ttl
+
+    def put(self, key, value):
+        """
+        Store the value in cache (evicting least recently used entries)
+
+        :param key: key of the entry
+        :param value: value to be stored
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = (value, time.monotonic())
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class AsyaServer:
+    """
+    Long-running Asya query service keeping pooled HTTP session,
+    cache of recent results and coalescing identical in-flight queries
+
+    :ivar api_endpoint: API endpoint to be used for communication
+    :ivar token: API token to be used
+    :ivar wait_rate_limit: wait for rate limit reset (see supervisor)
+    :ivar skip_404: skip not-found resources (see supervisor)
+    :ivar transport: name of HTTP transport of the pooled session
+                     (see :data:`asya.transport.TRANSPORTS`)
+    :ivar cache: cache of gathered results
+    :ivar inflight: futures of currently running gatherings by key
+    """
+
+    def __init__(self, api_endpoint, token, wait_rate_limit, skip_404,
+                 cache_size=128, ttl=300, transport='aiohttp'):
+        self.api_endpoint = api_endpoint
+        self.token = token
+        self.wait_rate_limit = wait_rate_limit
+        self.skip_404 = skip_404
+        self.transport = transport
+        self.cache = ResultCache(cache_size, ttl)
+        self.inflight = {}
+        self.session = None
+
+    def create_supervisor(self):
+        """Create new supervisor for single gathering"""
+        return AsyaSupervisor(self.api_endpoint, self.token,
+                              self.wait_rate_limit, self.skip_404)
+
+    @staticmethod
+    def cache_key(search_specs):
+        """Create hashable key of search specification"""
+        return tuple(sorted(search_specs.items()))
+
+    async def query(self, search_specs):
+        """
+        Get acquaintances for search specification, stale cached
+        result is returned immediately while refreshing in background
+
+        :param search_specs: dictionary with search specification
+        :type search_specs: dict
+        :return: tuple of result dict and flag if served from cache
+        :rtype: tuple
+        """
+        key = self.cache_key(search_specs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            result, fresh = cached
+            if not fresh:
+                self.refresh(key, search_specs)
+            return result, True
+        result = await asyncio.shield(self.refresh(key, search_specs))
+        return result, False
+
+    def refresh(self, key, search_specs):
+        """
+        Start gathering for given key unless it is already running
+
+        :return: future of the (shared) gathering
+        :rtype: asyncio.Future
+        """
+        if key in self.inflight:
+            return self.inflight[key]
+        future = asyncio.ensure_future(self._gather(key, search_specs))
+        self.inflight[key] = future
+
+        def done(fut):
+            del self.inflight[key]
+            if not fut.cancelled() and fut.exception() is not None:
+                logger.error('Gathering for %s failed', dict(key),
+                             exc_info=fut.exception())
+
+        future.add_done_callback(done)
+        return future
+
+    async def _gather(self, key, search_specs):
+        result = await gather_acquaintances_async(
+            dict(search_specs), self.create_supervisor(), self.session
+        )
+        result = dict(result)
+        self.cache.put(key, result)
+        return result
+
+    async def handle_acquaintances(self, request):
+        """Handle ``GET /acquaintances`` with search options as query"""
+        params = request.query
+        username = params.get('username')
+        involvement = params.get('involvement', 'author')
+        if username is None or involvement not in _user_involvement:
+            return web.json_response(
+                {'message': 'Missing username or invalid involvement'},
+                status=400
+            )
+        query_opts = {opt: params.get(opt) for opt in _query_opts}
+        search_specs = create_search_specs(
+            username, params.get('sort'), params.get('order'),
+            params.get('text'), involvement, query_opts
+        )
+        try:
+            result, cached = await self.query(search_specs)
+        except AsyaException as err:
+            return web.json_response({'message': err.message}, status=502)
+        except asyncio.TimeoutError:
+            return web.json_response(
+                {'message': 'GitHub API did not respond in time'}, status=504
+            )
+        except TRANSPORT_ERRORS as err:
+            return web.json_response(
+                {'message': 'GitHub API request failed: {}'.format(err)},
+                status=502
+            )
+        return web.json_response({
+            'query': search_specs['q'],
+            'cached': cached,
+            'acquaintances': result,
+        })
+
+    async def on_startup(self, app):
+        self.session = create_session(self.create_supervisor(),
+                                      self.transport)
+
+    async def on_cleanup(self, app):
+        for future in list(self.inflight.values()):
+            future.cancel()
+        await self.session.close()
+
+    def create_app(self):
+        """Create :class:`aiohttp.web.Application` of this server"""
+        app = web.Application()
+        app.router.add_get('/acquaintances', self.handle_acquaintances)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+@click.command()
+@click.option('-h', '--host', default='127.0.0.1',
+              help='Host to listen on.')
+@click.option('-p', '--port', type=int, default=8080,
+              help='Port to listen on.')
+@click.option('-t', '--token', default=None,
+              envvar='GITHUB_TOKEN', help='Personal GitHub token.')
+@click.option('-w', '--wait-rate-limit', is_flag=True,
+              help='Wait for rate limit reset if needed.')
+@click.option('-s', '--skip-404', is_flag=True,
+              help='Skip not-found GitHub resources (such as disabled repos).')
+@click.option('--cache-size', type=int, default=128,
+              help='Number of cached query results.')
+@click.option('--ttl', type=int, default=300,
+              help='Seconds while cached result is fresh.')
+@click.option('--api-endpoint', default='https://api.github.com',
+              help='GitHub API endpoint to be used.')
+@click.option('--transport', type=click.Choice(sorted(TRANSPORTS)),
+              default='aiohttp', help='HTTP transport (http2 needs httpx).')
+@click.version_option('0.1')
+def serve(host, port, token, wait_rate_limit, skip_404, cache_size, ttl,
+          api_endpoint, transport):
+    """Asya HTTP/JSON query server (via :mod:`aiohttp.web`)"""
+    server = AsyaServer(api_endpoint, token, wait_rate_limit, skip_404,
+                        cache_size, ttl, transport)
+    web.run_app(server.create_app(), host=host, port=port)
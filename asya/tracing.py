@@ -0,0 +1,203 @@
+import contextlib
+import itertools
+import json
+import os
+import time
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7, tracing is not available
+    ContextVar = None
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTracer:
+    """Tracer recording nothing (used when tracing is not enabled)"""
+
+    enabled = False
+    _null_span = _NullSpan()
+
+    def span(self, name, cat='asya', **args):
+        """Return no-op span context manager"""
+        return self._null_span
+
+
+_null_tracer = NullTracer()
+_active = None
+if ContextVar is not None:
+    _active = ContextVar('asya_tracer', default=None)
+
+
+def active_tracer():
+    """Tracer of the running gathering (:class:`NullTracer` if none)"""
+    if _active is None or _active.get() is None:
+        return _null_tracer
+    return _active.get()
+
+
+@contextlib.contextmanager
+def activated(tracer):
+    """
+    Context manager making the tracer active (see :func:`active_tracer`)
+    in the current task and tasks spawned within
+
+    :param tracer: tracer to be activated (None for no tracing)
+    :type tracer: asya.tracing.Tracer
+    """
+    if _active is None or tracer is None:
+        yield
+        return
+    token = _active.set(tracer)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+class _Span:
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.id = next(tracer._ids)
+        self.parent = None
+        self.start = None
+        self.end = None
+        self._token = None
+
+    def __enter__(self):
+        current = self.tracer._current
+        if current is not None:
+            self.parent = current.get()
+            self._token = current.set(self.id)
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = self.tracer.now()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        if self._token is not None:
+            self.tracer._current.reset(self._token)
+        self.tracer.spans.append(self)
+        return False
+
+
+class Tracer:
+    """
+    Tracer recording timeline spans with parent/child links which can
+    be saved in Chrome trace-event format (for Perfetto or
+    ``chrome://tracing``).
+
+    .. code ::
+
+       with tracer.span('issue', 'crawl', number=issue['number']):
+           ...  # spans opened here (also in spawned tasks) are children
+
+    Concurrent spans are laid out to separate tracks (threads) so that
+    each track is properly nested, children are placed in the track of
+    their parent whenever possible, otherwise linked by flow arrows.
+
+    :ivar spans: list of finished spans
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self._current = None
+        if ContextVar is not None:
+            self._current = ContextVar('asya_span', default=None)
+
+    def now(self):
+        """Microseconds since the tracer creation"""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def span(self, name, cat='asya', **args):
+        """
+        Create span context manager, span started inside another
+        span (in the same task or task spawned within) is its child
+
+        :param name: name of the span
+        :type name: str
+        :param cat: category of the span
+        :type cat: str
+        :param args: additional data shown with the span
+        :return: span context manager
+        """
+        return _Span(self, name, cat, args)
+
+    def _assign_tracks(self):
+        tracks = []  # stacks of open spans
+        track_of = {}
+
+        def fits(stack, span):
+            while stack and stack[-1].end <= span.start:
+                stack.pop()
+            return not stack or stack[-1].end >= span.end
+
+        for span in sorted(self.spans, key=lambda s: (s.start, -s.end)):
+            tid = track_of.get(span.parent)
+            if tid is None or not fits(tracks[tid], span):
+                tid = next((t for t, stack in enumerate(tracks)
+                            if fits(stack, span)), len(tracks))
+                if tid == len(tracks):
+                    tracks.append([])
+            tracks[tid].append(span)
+            track_of[span.id] = tid
+        return track_of
+
+    def events(self):
+        """
+        Create list of trace events from recorded spans
+
+        :return: list of trace events (dicts)
+        :rtype: list
+        """
+        pid = os.getpid()
+        track_of = self._assign_tracks()
+        events = []
+        for span in self.spans:
+            args = dict(span.args, span_id=span.id, parent_id=span.parent)
+            tid = track_of[span.id]
+            events.append({
+                'name': span.name, 'cat': span.cat, 'ph': 'X',
+                'ts': span.start, 'dur': span.end - span.start,
+                'pid': pid, 'tid': tid, 'args': args,
+            })
+            parent_tid = track_of.get(span.parent)
+            if parent_tid is not None and parent_tid != tid:
+                events.append({
+                    'name': 'spawn', 'cat': 'flow', 'ph': 's',
+                    'id': span.id, 'ts': span.start,
+                    'pid': pid, 'tid': parent_tid,
+                })
+                events.append({
+                    'name': 'spawn', 'cat': 'flow', 'ph': 'f', 'bp': 'e',
+                    'id': span.id, 'ts': span.start,
+                    'pid': pid, 'tid': tid,
+                })
+        return events
+
+    def dump(self, path):
+        """
+        Save recorded spans as trace-event JSON file
+
+        :param path: path of the output file
+        :type path: str
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events(),
+                       'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,133 @@
+import aiohttp
+from multidict import CIMultiDict
+
+from .tracing import active_tracer
+
+try:
+    import httpx
+except ImportError:  # optional, needed only for Http2Transport
+    httpx = None
+
+
+def _status_headers(headers, status, reason):
+    headers = CIMultiDict(headers)
+    if 'Status' not in headers:
+        headers['Status'] = '{} {}'.format(status, reason or '').rstrip()
+    return headers
+
+
+class Transport:
+    """
+    HTTP transport used for communication with the GitHub API,
+    it is used as asynchronous context manager (closed on exit):
+
+    .. code ::
+
+       async with AiohttpTransport({'User-Agent': 'Python/ASYA'}) as t:
+           data, headers = await t.get(url, {'page': 2})
+
+    :ivar headers: headers to be sent with every request
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    async def get(self, url, params=None):
+        """
+        Send GET request and decode JSON response
+
+        :param url: URL of the request
+        :type url: str
+        :param params: query parameters of the request
+        :type params: dict
+        :return: tuple of decoded data and case-insensitive response
+                 headers (always containing ``Status``)
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Close the transport (and all its connections)"""
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class AiohttpTransport(Transport):
+    """
+    HTTP/1.1 transport via :class:`aiohttp.ClientSession` (default),
+    each concurrent request needs own connection
+
+    :ivar limit: max number of connections (None for aiohttp default)
+    """
+
+    def __init__(self, headers, limit=None):
+        super().__init__(headers)
+        self.limit = limit
+        self.session = None
+
+    async def get(self, url, params=None):
+        if self.session is None:
+            connector = None
+            if self.limit is not None:
+                connector = aiohttp.TCPConnector(limit=self.limit)
+            self.session = aiohttp.ClientSession(headers=self.headers,
+                                                 connector=connector)
+        async with self.session.get(url, params=params) as response:
+            with active_tracer().span('json_decode', 'cpu'):
+                data = await response.json()
+            return data, _status_headers(response.headers, response.status,
+                                         response.reason)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class Http2Transport(Transport):
+    """
+    HTTP/2 transport via :class:`httpx.AsyncClient` (requires
+    ``httpx[http2]``), concurrent requests are multiplexed over
+    few connections
+
+    :ivar connections: max number of connections
+    """
+
+    def __init__(self, headers, connections=4):
+        if httpx is None:
+            raise ImportError('Http2Transport requires httpx with HTTP/2 '
+                              'support (pip install httpx[http2])')
+        super().__init__(headers)
+        self.connections = connections
+        self.client = httpx.AsyncClient(
+            http1=False, http2=True, headers=headers, timeout=None,
+            limits=httpx.Limits(max_connections=connections,
+                                max_keepalive_connections=connections)
+        )
+
+    async def get(self, url, params=None):
+        response = await self.client.get(url, params=params)
+        with active_tracer().span('json_decode', 'cpu'):
+            data = response.json()
+        return data, _status_headers(response.headers.multi_items(),
+                                     response.status_code,
+                                     response.reason_phrase)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+#: Available transports by names
+TRANSPORTS = {
+    'aiohttp': AiohttpTransport,
+    'http2': Http2Transport,
+}
+
+#: Exceptions raised by transports when the request fails
+TRANSPORT_ERRORS = (aiohttp.ClientError, )
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.HTTPError, )
@@ -17,6 +17,8 @@ setup(
     entry_points={
         'console_scripts': [
             'asya = asya:main',
+            'asya-serve = asya.server:serve',
+            'asya-bench = asya.benchmark:bench',
         ]
     },
     install_requires=[
@@ -24,6 +26,9 @@ setup(
         'requests',
         'click'
     ],
+    extras_require={
+        'http2': ['httpx[http2]'],
+    },
     python_requires='>=3.4',
     classifiers=[
         'Development Status :: 1 - Planning',